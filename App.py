@@ -1,9 +1,24 @@
 import os
+import gc
+import asyncio
+import time
 import streamlit as st
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
-from langchain_google_genai import ChatGoogleGenerativeAI
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from dotenv import load_dotenv
+from pipeline import (
+    FETCH_POLL_INTERVAL,
+    FETCH_TIMEOUT,
+    extract_video_id,
+    fetch_all,
+    fetch_error_message,
+    get_embeddings,
+    get_executor,
+    get_llm,
+    get_query_cache,
+    load_vectorstore,
+    make_video_key,
+)
+from cache import session_vectorstores
 
 # Configuration
 
@@ -20,60 +35,110 @@ st.markdown("Ask Questions related to Youtube Video")
 st.markdown("---")
 
 # Initialize session state
-if 'transcript_text' not in st.session_state:
-    st.session_state.transcript_text = ""
 if 'video_title' not in st.session_state:
     st.session_state.video_title = ""
+if 'video_key' not in st.session_state:
+    st.session_state.video_key = ""
+if 'pending_fetch' not in st.session_state:
+    st.session_state.pending_fetch = None
+    st.session_state.pending_started = None
+
+# Answers are cached per video key (video IDs + transcript hash)
+query_cache = get_query_cache()
+
+# The vectorstore lives outside session state so abandoned sessions are evicted
+session_id = get_script_run_ctx().session_id
+vectorstore = session_vectorstores.get(session_id)
 
 # -------------------------
 # Step 1: Get YouTube Transcript
 # -------------------------
 st.subheader("1️⃣ Load YouTube Video")
-video_url = st.text_input("Enter YouTube Video URL:", placeholder="https://www.youtube.com/watch?v=...")
+video_url = st.text_area(
+    "Enter YouTube Video URL(s), one per line:",
+    placeholder="https://www.youtube.com/watch?v=...",
+    height=100
+)
+no_cache = st.checkbox("Bypass transcript cache", value=False)
 fetch_button = st.button("🔄 Fetch Transcript", use_container_width=True)
 
 if fetch_button and video_url:
     # Reset session state
-    st.session_state.transcript_text = ""
     st.session_state.video_title = ""
-
-    with st.spinner("Fetching transcript..."):
+    st.session_state.video_key = ""
+    session_vectorstores.pop(session_id)
+    vectorstore = None
+
+    # 1. Extract video IDs (one URL per line, duplicates dropped)
+    video_ids = list(dict.fromkeys(
+        extract_video_id(url) for url in video_url.splitlines() if url.strip()
+    ))
+
+    # 2. Fetch all transcripts concurrently on a worker thread, so the page keeps rendering
+    st.session_state.pending_fetch = get_executor().submit(
+        asyncio.run, fetch_all(video_ids, use_cache=not no_cache)
+    )
+    st.session_state.pending_started = None
+
+pending_fetch = st.session_state.pending_fetch
+if pending_fetch is not None and not pending_fetch.done():
+    # Poll with reruns rather than blocking the script thread. The pool is shared by all
+    # sessions, so the timeout counts from when the fetch starts running, not while it queues
+    if st.session_state.pending_started is None and pending_fetch.running():
+        st.session_state.pending_started = time.monotonic()
+    started = st.session_state.pending_started
+    if started is None or time.monotonic() - started < FETCH_TIMEOUT:
+        st.info("⏳ Fetching transcripts..." if started is not None else "⏳ Waiting for a free worker...")
+        time.sleep(FETCH_POLL_INTERVAL)
+        st.rerun()
+    # A running fetch can't be cancelled; it keeps going and still fills the transcript cache
+    st.session_state.pending_fetch = None
+    st.error("❌ Timed out fetching transcripts. The fetch may still finish in the background "
+             "and fill the cache, so trying again shortly can be instant.")
+elif pending_fetch is not None:
+    st.session_state.pending_fetch = None
+
+    with st.spinner("Processing transcript..."):
         try:
-            # 1. Extract video ID
-            if "v=" in video_url:
-                video_id = video_url.split("v=")[1].split("&")[0]
-            elif "youtu.be/" in video_url:
-                video_id = video_url.split("youtu.be/")[1].split("?")[0]
-            else:
-                video_id = video_url.strip()
+            results = pending_fetch.result()
 
-            st.session_state.video_title = f"Video ID: {video_id}"
+            transcripts = {}
+            for video_id, result in results.items():
+                if isinstance(result, Exception):
+                    st.error(fetch_error_message(video_id, result))
+                else:
+                    transcripts[video_id] = result
 
-            # 2. Fetch transcript using the v1.2+ API
-            ytt_api = YouTubeTranscriptApi()
-            fetched_transcript = ytt_api.fetch(video_id)
+            if not transcripts:
+                raise ValueError("No transcripts could be fetched.")
 
-            # Convert to text format
-            st.session_state.transcript_text = " ".join([snippet.text for snippet in fetched_transcript])
+            st.session_state.video_title = "Video ID: " + ", ".join(transcripts)
+            transcript_text = "\n\n".join(transcripts.values())
 
-            st.success(f"✅ Transcript successfully fetched!")
-            st.info(f"📝 Transcript length: {len(st.session_state.transcript_text)} characters")
+            # Key cached answers by video and transcript content, so re-captioned videos start fresh
+            st.session_state.video_key = make_video_key(transcripts)
+            if no_cache:
+                query_cache.invalidate(st.session_state.video_key)
+
+            # 3. Reuse the saved FAISS index for this transcript, or split, embed and save a new one
+            vectorstore = load_vectorstore(st.session_state.video_key, transcript_text, rebuild=no_cache)
+            session_vectorstores.set(session_id, vectorstore)
+            chunk_count = vectorstore.index.ntotal
+
+            st.success(f"✅ Transcript successfully fetched! Split into {chunk_count} chunks.")
+            st.info(f"📝 Transcript length: {len(transcript_text)} characters")
 
             # Display transcript preview
             with st.expander("📄 View Transcript Preview"):
-                preview_length = min(2000, len(st.session_state.transcript_text))
+                preview_length = min(2000, len(transcript_text))
                 st.text_area(
                     "First 2000 characters:",
-                    st.session_state.transcript_text[:preview_length] + (
-                        "..." if len(st.session_state.transcript_text) > 2000 else ""),
+                    transcript_text[:preview_length] + (
+                        "..." if len(transcript_text) > 2000 else ""),
                     height=300,
                     disabled=True
                 )
 
-        except TranscriptsDisabled:
-            st.error("❌ Transcripts are disabled for this video.")
-        except NoTranscriptFound:
-            st.error("❌ No transcript found for this video. The video may not have captions.")
         except Exception as e:
             st.error(f"❌ Error during processing: {str(e)}")
             st.info("💡 Make sure the URL is correct and the video has captions enabled.")
@@ -85,7 +150,7 @@ st.markdown("---")
 st.subheader("2️⃣ Ask Questions About the Video")
 
 # Only show chat interface if transcript is loaded
-if st.session_state.transcript_text:
+if vectorstore:
     st.success(f"✓ Ready to answer questions about: {st.session_state.video_title}")
 
     user_input = st.text_area(
@@ -99,21 +164,40 @@ if st.session_state.transcript_text:
         generate_button = st.button("💬 Generate Response", type="primary", use_container_width=True)
     with col2:
         if st.button("🗑️ Clear", use_container_width=True):
-            st.session_state.transcript_text = ""
+            # Drop the vectorstore outright and reclaim its memory before rerunning
+            session_vectorstores.pop(session_id)
+            gc.collect()
             st.session_state.video_title = ""
+            st.session_state.video_key = ""
             st.rerun()
 
     if generate_button and user_input:
         with st.spinner("🤔 Thinking..."):
             try:
-                # Initialize Gemini 2.5 Flash (FREE!)
-                llm = ChatGoogleGenerativeAI(
-                    model="gemini-2.5-flash",
-                    temperature=0.3
-                )
+                video_key = st.session_state.video_key
+
+                # Check the query cache: exact question first, then semantically similar ones
+                answer = query_cache.get_exact(video_key, user_input)
+                if answer is None:
+                    query_embedding = get_embeddings().embed_query(user_input)
+                    answer = query_cache.get_similar(video_key, query_embedding)
+                from_cache = answer is not None
 
-                # Create the prompt with full transcript context
-                prompt = f"""You are a helpful YouTube Video Assistant. Answer the user's question based on the video transcript below.
+                # Display response
+                st.markdown("### 🤖 AI Response:")
+                if from_cache:
+                    st.caption("⚡ Answered from cache")
+                    st.markdown(answer)
+                else:
+                    # Initialize Gemini 2.5 Flash (FREE!)
+                    llm = get_llm("gemini-2.5-flash", 0.3)
+
+                    # Retrieve only the top 4 transcript chunks relevant to the question
+                    docs = vectorstore.similarity_search_by_vector(query_embedding, k=4)
+                    context = "\n\n".join(doc.page_content for doc in docs)
+
+                    # Create the prompt with the retrieved transcript context
+                    prompt = f"""You are a helpful YouTube Video Assistant. Answer the user's question based on the video transcript below.
 
 IMPORTANT INSTRUCTIONS:
 - Use ONLY the information from the video transcript provided
@@ -123,18 +207,15 @@ IMPORTANT INSTRUCTIONS:
 - Quote relevant parts when helpful
 
 VIDEO TRANSCRIPT:
-{st.session_state.transcript_text}
+{context}
 
 USER QUESTION: {user_input}
 
 DETAILED ANSWER:"""
 
-                # Get response from Gemini
-                response = llm.invoke(prompt)
-
-                # Display response
-                st.markdown("### 🤖 AI Response:")
-                st.markdown(response.content)
+                    # Stream the response from Gemini as it is generated
+                    answer = st.write_stream(chunk.content for chunk in llm.stream(prompt))
+                    query_cache.set(video_key, user_input, query_embedding, answer)
 
             except Exception as e:
                 st.error(f"❌ Error generating response: {str(e)}")
@@ -148,8 +229,4 @@ st.markdown("""
 <div style='text-align: center; color: #666; font-size: 0.9em;'>
     <p>💡 <b>Tips:</b> This tool works best with videos that have accurate captions/transcripts.</p>
 </div>
-""", unsafe_allow_html=True)
-
-# Add note about long transcripts
-if st.session_state.transcript_text and len(st.session_state.transcript_text) > 50000:
-    st.warning("⚠️ This transcript is quite long. For very long videos, responses might be slower or hit token limits.")
\ No newline at end of file
+""", unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+import zstandard as zstd
+from cachetools import TTLCache
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/yt_chat/queries.sqlite3")
+ZSTD_LEVEL = 3
+
+
+def compress_text(text):
+    """Compress text with zstd for compact storage in session state."""
+    # The module-level helpers are thread-safe, unlike shared compressor objects
+    return zstd.compress(text.encode("utf-8"), ZSTD_LEVEL)
+
+
+@functools.lru_cache(maxsize=4)
+def decompress_text(blob):
+    """Decompress text stored with compress_text, memoizing recent results."""
+    return zstd.decompress(blob).decode("utf-8")
+
+
+class SemanticQueryCache:
+    """Two-layer cache of answered questions, scoped per video.
+
+    Questions are first looked up by the SHA256 hash of their text, then by
+    cosine similarity of their embedding against previously answered
+    questions for the same video. Entries older than ``ttl`` seconds are
+    ignored and purged on the next write.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, threshold=0.98, ttl=86400):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    video_id TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    PRIMARY KEY (video_id, prompt_hash)
+                )
+            """)
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across Streamlit threads
+        return closing(sqlite3.connect(self.path))
+
+    @staticmethod
+    def _hash(prompt):
+        return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_exact(self, video_id, prompt):
+        """Return the cached response for this exact prompt, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response FROM query_cache WHERE video_id = ? AND prompt_hash = ? AND ts >= ?",
+                (video_id, self._hash(prompt), time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_similar(self, video_id, embedding):
+        """Return the response of the most similar cached prompt above the threshold, or None."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT embedding, response FROM query_cache WHERE video_id = ? AND ts >= ?",
+                (video_id, time.time() - self.ttl),
+            ).fetchall()
+        if not rows:
+            return None
+
+        # Stored embeddings are already unit length, so the dot product is the cosine similarity
+        matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for blob, _ in rows])
+        scores = matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        return rows[best][1] if scores[best] >= self.threshold else None
+
+    def set(self, video_id, prompt, embedding, response):
+        """Store a response and purge expired entries."""
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM query_cache WHERE ts < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?)",
+                (video_id, self._hash(prompt), self._normalize(embedding).tobytes(), response, now),
+            )
+
+    def invalidate(self, video_id):
+        """Drop all cached responses for a video."""
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM query_cache WHERE video_id = ?", (video_id,))
+
+
+class SessionStore:
+    """Process-wide store of large per-session objects, bounded by size and idle time.
+
+    Streamlit never drops ``st.session_state`` for closed tabs, so objects such
+    as FAISS indexes are kept here instead, keyed by session ID. Entries expire
+    after ``ttl`` seconds without access, and the least recently used entry is
+    evicted once ``maxsize`` sessions are stored.
+    """
+
+    def __init__(self, maxsize=32, ttl=1800):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the object stored for a session, or None, refreshing its expiry."""
+        with self._lock:
+            value = self._cache.get(session_id)
+            if value is not None:
+                self._cache[session_id] = value
+            return value
+
+    def set(self, session_id, value):
+        with self._lock:
+            self._cache[session_id] = value
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._cache.pop(session_id, None)
+
+
+# Shared across reruns and sessions, since imported modules outlive each script run
+session_vectorstores = SessionStore(maxsize=32, ttl=1800)
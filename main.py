@@ -1,13 +1,28 @@
 import os
+import gc
+import asyncio
+import time
 import streamlit as st
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from operator import itemgetter
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
+from pipeline import (
+    FETCH_POLL_INTERVAL,
+    FETCH_TIMEOUT,
+    extract_video_id,
+    fetch_all,
+    fetch_error_message,
+    get_embeddings,
+    get_executor,
+    get_llm,
+    get_query_cache,
+    load_vectorstore,
+    make_video_key,
+)
+from cache import compress_text, decompress_text, session_vectorstores
 
 # -------------------------
 # Configuration
@@ -25,76 +40,184 @@ st.title("🎥 YouTube Transcript Chat Assistant")
 st.markdown("Ask questions about any YouTube video with transcripts!")
 st.markdown("---")
 
-# Initialize session state for transcript and vectorstore
-if 'transcript_text' not in st.session_state:
-    st.session_state.transcript_text = ""
-if 'vectorstore' not in st.session_state:
-    st.session_state.vectorstore = None
+# Initialize session state for transcript
+# The transcript is kept zstd-compressed, as it can be hundreds of KB per session
+if 'transcript_blob' not in st.session_state:
+    st.session_state.transcript_blob = b""
 if 'video_title' not in st.session_state:
     st.session_state.video_title = ""
+if 'video_key' not in st.session_state:
+    st.session_state.video_key = ""
+if 'mode' not in st.session_state:
+    st.session_state.mode = ""  # "stuff" (full transcript in prompt) or "rag"
+if 'pending_fetch' not in st.session_state:
+    st.session_state.pending_fetch = None
+    st.session_state.pending_started = None
+
+# -------------------------
+# RAG Prompt
+# -------------------------
+RAG_TEMPLATE = """You are a helpful YouTube Video Assistant. Your job is to answer questions based on the video transcript provided.
+
+IMPORTANT INSTRUCTIONS:
+- Use ONLY the information from the context (video transcript) below
+- Provide detailed, well-structured answers
+- If the answer cannot be found in the transcript, clearly state: "This information is not available in the video transcript."
+- Quote relevant parts when helpful
+- Be conversational and helpful
+
+Context from video transcript:
+{context}
+
+Question: {question}
+
+Detailed Answer:"""
+
+# -------------------------
+# Chains
+# -------------------------
+@st.cache_resource
+def get_rag_prompt():
+    return PromptTemplate(
+        template=RAG_TEMPLATE,
+        input_variables=["context", "question"]
+    )
+
+
+@st.cache_resource
+def get_stuff_chain():
+    return get_rag_prompt() | get_llm("gemini-1.5-flash", 0.3) | StrOutputParser()
+
+
+def _retrieve_context(inputs):
+    # Search by the question's precomputed embedding and pass only the chunk text on to the prompt
+    docs = inputs["vectorstore"].similarity_search_by_vector(inputs["embedding"], k=4)  # Retrieve top 4 relevant chunks
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+# The vectorstore is passed in with each question rather than held by the chain, so
+# clearing or evicting a session's index actually frees it
+@st.cache_resource
+def get_qa_chain():
+    return (
+        {
+            "context": RunnableLambda(_retrieve_context),
+            "question": itemgetter("question")
+        }
+        | get_rag_prompt()
+        | get_llm("gemini-1.5-flash", 0.3)  # Gemini Flash, corrected model name
+        | StrOutputParser()
+    )
+
+# Answers are cached per video key (video IDs + transcript hash)
+query_cache = get_query_cache()
+
+# The vectorstore lives outside session state so abandoned sessions are evicted
+session_id = get_script_run_ctx().session_id
+vectorstore = session_vectorstores.get(session_id)
+
+# Transcripts shorter than this (~8k tokens) are sent in full instead of through RAG
+STUFF_MAX_CHARS = 30_000
 
 # -------------------------
 # Step 1: Get YouTube Transcript
 # -------------------------
 st.subheader("1️⃣ Load YouTube Video")
-video_url = st.text_input("Enter YouTube Video URL:", placeholder="https://www.youtube.com/watch?v=...")
+video_url = st.text_area(
+    "Enter YouTube Video URL(s), one per line:",
+    placeholder="https://www.youtube.com/watch?v=...",
+    height=100
+)
+no_cache = st.checkbox("Bypass transcript cache", value=False)
 fetch_button = st.button("🔄 Fetch & Process Transcript", use_container_width=True)
 
 if fetch_button and video_url:
     # Reset session state
-    st.session_state.transcript_text = ""
-    st.session_state.vectorstore = None
+    st.session_state.transcript_blob = b""
     st.session_state.video_title = ""
+    st.session_state.video_key = ""
+    st.session_state.mode = ""
+    session_vectorstores.pop(session_id)
+    vectorstore = None
+
+    # 1. Extract video IDs (one URL per line, duplicates dropped)
+    video_ids = list(dict.fromkeys(
+        extract_video_id(url) for url in video_url.splitlines() if url.strip()
+    ))
+
+    # 2. Fetch all transcripts concurrently on a worker thread, so the page keeps rendering
+    st.session_state.pending_fetch = get_executor().submit(
+        asyncio.run, fetch_all(video_ids, use_cache=not no_cache)
+    )
+    st.session_state.pending_started = None
+
+pending_fetch = st.session_state.pending_fetch
+if pending_fetch is not None and not pending_fetch.done():
+    # Poll with reruns rather than blocking the script thread. The pool is shared by all
+    # sessions, so the timeout counts from when the fetch starts running, not while it queues
+    if st.session_state.pending_started is None and pending_fetch.running():
+        st.session_state.pending_started = time.monotonic()
+    started = st.session_state.pending_started
+    if started is None or time.monotonic() - started < FETCH_TIMEOUT:
+        st.info("⏳ Fetching transcripts..." if started is not None else "⏳ Waiting for a free worker...")
+        time.sleep(FETCH_POLL_INTERVAL)
+        st.rerun()
+    # A running fetch can't be cancelled; it keeps going and still fills the transcript cache
+    st.session_state.pending_fetch = None
+    st.error("❌ Timed out fetching transcripts. The fetch may still finish in the background "
+             "and fill the cache, so trying again shortly can be instant.")
+elif pending_fetch is not None:
+    st.session_state.pending_fetch = None
 
-    with st.spinner("Fetching and processing transcript..."):
+    with st.spinner("Processing transcript..."):
         try:
-            # 1. Extract video ID
-            if "v=" in video_url:
-                video_id = video_url.split("v=")[1].split("&")[0]
-            elif "youtu.be/" in video_url:
-                video_id = video_url.split("youtu.be/")[1].split("?")[0]
-            else:
-                video_id = video_url.strip()
+            results = pending_fetch.result()
 
-            st.session_state.video_title = f"Video ID: {video_id}"
+            transcripts = {}
+            for video_id, result in results.items():
+                if isinstance(result, Exception):
+                    st.error(fetch_error_message(video_id, result))
+                else:
+                    transcripts[video_id] = result
 
-            # 2. Fetch transcript using the v1.2+ API
-            ytt_api = YouTubeTranscriptApi()
-            fetched_transcript = ytt_api.fetch(video_id)
+            if not transcripts:
+                raise ValueError("No transcripts could be fetched.")
 
-            # Convert to the format we need (list of dicts with 'text' key)
-            st.session_state.transcript_text = " ".join([snippet.text for snippet in fetched_transcript])
+            st.session_state.video_title = "Video ID: " + ", ".join(transcripts)
+            transcript_text = "\n\n".join(transcripts.values())
+            st.session_state.transcript_blob = compress_text(transcript_text)
 
-            # 3. Split transcript for embeddings
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
-            )
-            chunks = splitter.split_text(st.session_state.transcript_text)
+            # Key cached answers by video and transcript content, so re-captioned videos start fresh
+            st.session_state.video_key = make_video_key(transcripts)
+            if no_cache:
+                query_cache.invalidate(st.session_state.video_key)
 
-            # 4. Create embeddings & FAISS vectorstore
-            embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-            st.session_state.vectorstore = FAISS.from_texts(chunks, embeddings)
+            # 3. Short transcripts fit in the prompt whole, so skip embedding and indexing
+            if len(transcript_text) < STUFF_MAX_CHARS:
+                st.session_state.mode = "stuff"
+                st.success("✅ Transcript successfully processed! Short enough to answer from the full text.")
+            else:
+                st.session_state.mode = "rag"
 
-            st.success(f"✅ Transcript successfully processed! Split into {len(chunks)} chunks.")
-            st.info(f"📝 Transcript length: {len(st.session_state.transcript_text)} characters")
+                # 4. Reuse the saved FAISS index for this transcript, or split, embed and save a new one
+                vectorstore = load_vectorstore(st.session_state.video_key, transcript_text, rebuild=no_cache)
+                session_vectorstores.set(session_id, vectorstore)
+                chunk_count = vectorstore.index.ntotal
+
+                st.success(f"✅ Transcript successfully processed! Split into {chunk_count} chunks.")
+            st.info(f"📝 Transcript length: {len(transcript_text)} characters")
 
             # Display transcript preview
             with st.expander("📄 View Transcript Preview"):
-                preview_length = min(2000, len(st.session_state.transcript_text))
+                preview_length = min(2000, len(transcript_text))
                 st.text_area(
                     "First 2000 characters:",
-                    st.session_state.transcript_text[:preview_length] + (
-                        "..." if len(st.session_state.transcript_text) > 2000 else ""),
+                    transcript_text[:preview_length] + (
+                        "..." if len(transcript_text) > 2000 else ""),
                     height=300,
                     disabled=True
                 )
 
-        except TranscriptsDisabled:
-            st.error("❌ Transcripts are disabled for this video.")
-        except NoTranscriptFound:
-            st.error("❌ No transcript found for this video. The video may not have captions.")
         except Exception as e:
             st.error(f"❌ Error during processing: {str(e)}")
             st.info("💡 Make sure the URL is correct and the video has captions enabled.")
@@ -106,7 +229,7 @@ st.markdown("---")
 st.subheader("2️⃣ Ask Questions About the Video")
 
 # Only show chat interface if transcript is loaded
-if st.session_state.vectorstore:
+if st.session_state.mode == "stuff" or vectorstore:
     st.success(f"✓ Ready to answer questions about: {st.session_state.video_title}")
 
     user_input = st.text_area(
@@ -120,59 +243,48 @@ if st.session_state.vectorstore:
         generate_button = st.button("💬 Generate Response", type="primary", use_container_width=True)
     with col2:
         if st.button("🗑️ Clear", use_container_width=True):
-            st.session_state.transcript_text = ""
-            st.session_state.vectorstore = None
+            # Drop the large objects outright and reclaim their memory before rerunning
+            del st.session_state.transcript_blob
+            session_vectorstores.pop(session_id)
+            gc.collect()
             st.session_state.video_title = ""
+            st.session_state.video_key = ""
+            st.session_state.mode = ""
             st.rerun()
 
     if generate_button and user_input:
         with st.spinner("🤔 Thinking..."):
             try:
-                # 1. Define the LLM (using Gemini Flash - corrected model name)
-                llm = ChatGoogleGenerativeAI(
-                    model="gemini-1.5-flash",  # Fixed model name
-                    temperature=0.3
-                )
-
-                # 2. Define the Prompt Template for the RAG chain
-                template = """You are a helpful YouTube Video Assistant. Your job is to answer questions based on the video transcript provided.
-
-IMPORTANT INSTRUCTIONS:
-- Use ONLY the information from the context (video transcript) below
-- Provide detailed, well-structured answers
-- If the answer cannot be found in the transcript, clearly state: "This information is not available in the video transcript."
-- Quote relevant parts when helpful
-- Be conversational and helpful
-
-Context from video transcript:
-{context}
-
-Question: {question}
-
-Detailed Answer:"""
-
-                RAG_PROMPT = PromptTemplate(
-                    template=template,
-                    input_variables=["context", "question"]
-                )
-
-                # 3. Create the RAG Chain
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm,
-                    chain_type="stuff",
-                    retriever=st.session_state.vectorstore.as_retriever(
-                        search_kwargs={"k": 4}  # Retrieve top 4 relevant chunks
-                    ),
-                    chain_type_kwargs={"prompt": RAG_PROMPT},
-                    return_source_documents=False
-                )
+                video_key = st.session_state.video_key
 
-                # 4. Run the chain with the user's question
-                response = qa_chain.invoke({"query": user_input})
+                # 1. Check the query cache: exact question first, then semantically similar ones
+                answer = query_cache.get_exact(video_key, user_input)
+                if answer is None:
+                    query_embedding = get_embeddings().embed_query(user_input)
+                    answer = query_cache.get_similar(video_key, query_embedding)
+                from_cache = answer is not None
 
                 # Display response
                 st.markdown("### 🤖 AI Response:")
-                st.markdown(response['result'])
+                if from_cache:
+                    st.caption("⚡ Answered from cache")
+                    st.markdown(answer)
+                else:
+                    if st.session_state.mode == "stuff":
+                        # 2. Short transcript: answer from the full text, streaming the answer into the page
+                        answer = st.write_stream(get_stuff_chain().stream({
+                            "context": decompress_text(st.session_state.transcript_blob),
+                            "question": user_input
+                        }))
+                    else:
+                        # 2. Run the shared RAG chain over this session's vectorstore, streaming the answer into the page
+                        answer = st.write_stream(get_qa_chain().stream({
+                            "question": user_input,
+                            "embedding": query_embedding,
+                            "vectorstore": vectorstore
+                        }))
+                    # 3. Cache the answer for repeat and similar questions, whichever way it was produced
+                    query_cache.set(video_key, user_input, query_embedding, answer)
 
             except Exception as e:
                 st.error(f"❌ Error generating response: {str(e)}")
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import diskcache
+import faiss
+import streamlit as st
+from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+
+from cache import SemanticQueryCache
+
+# -------------------------
+# Caches
+# -------------------------
+# Transcripts are cached in memory per process and on disk across processes
+TRANSCRIPT_CACHE_DIR = os.path.expanduser("~/.cache/yt_chat/transcripts")
+TRANSCRIPT_CACHE_TTL = 86400  # 24 hours
+
+# Chunk embeddings are cached on disk by content hash, so re-processing a video is free
+EMBEDDING_CACHE_DIR = os.path.expanduser("~/.cache/yt_chat/embeddings")
+
+# FAISS indexes are saved per video key, so repeat loads skip splitting and embedding entirely
+FAISS_CACHE_DIR = os.path.expanduser("~/.cache/yt_chat/faiss")
+
+# Chunks are embedded in batches sent concurrently, instead of one serial request after another
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_WORKERS = 8
+
+# Transcript fetches run on a shared worker pool, polled every 0.1 s for up to a minute of run time
+FETCH_POLL_INTERVAL = 0.1
+FETCH_TIMEOUT = 60
+
+# Long transcripts get an int8-quantized HNSW index: ~4x smaller and sublinear search
+HNSW_MIN_CHUNKS = 200
+
+
+# -------------------------
+# Shared Clients
+# -------------------------
+# Created once per process and shared by all sessions, instead of on every rerun
+@st.cache_resource
+def get_llm(model, temperature):
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature)
+
+
+@st.cache_resource
+def get_embeddings():
+    return GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+
+
+@st.cache_resource
+def get_query_cache():
+    return SemanticQueryCache()
+
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+# -------------------------
+# Transcripts
+# -------------------------
+def fetch_transcript_text(video_id):
+    """Fetch the transcript for a video from YouTube, bypassing all caches."""
+    ytt_api = YouTubeTranscriptApi()
+    fetched_transcript = ytt_api.fetch(video_id)
+    return " ".join(snippet.text for snippet in fetched_transcript)
+
+
+@st.cache_data(ttl=TRANSCRIPT_CACHE_TTL, show_spinner=False)
+def get_transcript_text(video_id):
+    """Return the transcript for a video, using the disk cache when available."""
+    with diskcache.Cache(TRANSCRIPT_CACHE_DIR) as cache:
+        transcript_text = cache.get(video_id)
+        if transcript_text is None:
+            transcript_text = fetch_transcript_text(video_id)
+            cache.set(video_id, transcript_text, expire=TRANSCRIPT_CACHE_TTL)
+    return transcript_text
+
+
+def refresh_transcript_text(video_id):
+    """Fetch a fresh transcript from YouTube and write it back to the disk cache."""
+    transcript_text = fetch_transcript_text(video_id)
+    with diskcache.Cache(TRANSCRIPT_CACHE_DIR) as cache:
+        cache.set(video_id, transcript_text, expire=TRANSCRIPT_CACHE_TTL)
+    return transcript_text
+
+
+# Matches watch, youtu.be, embed and shorts URLs
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|youtube\.com/(?:embed|shorts)/)([A-Za-z0-9_-]{11})")
+
+
+def extract_video_id(video_url):
+    """Extract the video ID from a YouTube URL, or return the input as-is."""
+    m = _VIDEO_ID_RE.search(video_url)
+    return m.group(1) if m else video_url.strip()
+
+
+async def _fetch_one(fetch, video_id):
+    # Return errors instead of raising so one bad video doesn't cancel the batch
+    try:
+        return await asyncio.to_thread(fetch, video_id)
+    except Exception as e:
+        return e
+
+
+async def fetch_all(video_ids, use_cache=True):
+    """Fetch transcripts for several videos concurrently.
+
+    Returns a dict mapping each video ID to its transcript text, or to the
+    exception raised while fetching it.
+    """
+    fetch = get_transcript_text if use_cache else refresh_transcript_text
+    async with asyncio.TaskGroup() as tg:
+        tasks = {video_id: tg.create_task(_fetch_one(fetch, video_id)) for video_id in video_ids}
+    if not use_cache:
+        # Drop stale in-memory copies of just these videos, so later cached fetches read the refreshed disk entries
+        for video_id in video_ids:
+            get_transcript_text.clear(video_id)
+    return {video_id: task.result() for video_id, task in tasks.items()}
+
+
+def fetch_error_message(video_id, error):
+    """Return the message shown to the user when a video's transcript cannot be fetched."""
+    if isinstance(error, TranscriptsDisabled):
+        return f"❌ Transcripts are disabled for video {video_id}."
+    elif isinstance(error, NoTranscriptFound):
+        return f"❌ No transcript found for video {video_id}. The video may not have captions."
+    return f"❌ Error fetching video {video_id}: {str(error)}"
+
+
+def make_video_key(transcripts):
+    """Key cached answers and indexes by video IDs and transcript content.
+
+    Re-captioned videos get a new key, so they never hit stale caches.
+    """
+    transcript_text = "\n\n".join(transcripts.values())
+    transcript_hash = hashlib.sha256(transcript_text.encode("utf-8")).hexdigest()[:16]
+    return ",".join(transcripts) + "@" + transcript_hash
+
+
+# -------------------------
+# Vectorstore
+# -------------------------
+def dedupe_chunks(chunks):
+    """Drop chunks whose case- and whitespace-normalized text repeats an earlier chunk."""
+    seen = set()
+    unique_chunks = []
+    for chunk in chunks:
+        key = hashlib.sha1(" ".join(chunk.lower().split()).encode("utf-8")).digest()
+        if key not in seen:
+            seen.add(key)
+            unique_chunks.append(chunk)
+    return unique_chunks
+
+
+def embed_chunks(chunks, embeddings):
+    """Embed chunks in concurrent batches, returning vectors in chunk order."""
+    batches = [chunks[i:i + EMBED_BATCH_SIZE] for i in range(0, len(chunks), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as executor:
+        return [vector for batch in executor.map(embeddings.embed_documents, batches) for vector in batch]
+
+
+def build_vectorstore(chunks, embeddings):
+    """Build a FAISS vectorstore, using a quantized HNSW index for long transcripts."""
+    vectors = embed_chunks(chunks, embeddings)
+    vectorstore = FAISS.from_embeddings(zip(chunks, vectors), embeddings)
+    if len(chunks) >= HNSW_MIN_CHUNKS:
+        # Vectors keep their positions, so the docstore ID mapping stays valid
+        vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+        index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, 32)
+        index.train(vectors)
+        index.add(vectors)
+        vectorstore.index = index
+    return vectorstore
+
+
+def _is_saved_index(index_dir):
+    return all(os.path.isfile(os.path.join(index_dir, name)) for name in ("index.faiss", "index.pkl"))
+
+
+def save_vectorstore(vectorstore, index_dir):
+    """Save a vectorstore so other sessions never see a partially written index."""
+    # Save into a temp directory on the same filesystem, then move it into place in one rename
+    os.makedirs(FAISS_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=FAISS_CACHE_DIR, prefix=".tmp-")
+    try:
+        vectorstore.save_local(tmp_dir)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp_dir, index_dir)
+    except OSError:
+        # Another session saved the same index first; theirs is just as good
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_vectorstore(video_key, transcript_text, rebuild=False):
+    """Load the saved FAISS index for a video key, or split, embed and save a new one."""
+    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
+        get_embeddings(),
+        LocalFileStore(EMBEDDING_CACHE_DIR),
+        namespace="embedding-001",
+        key_encoder="sha256"
+    )
+
+    # Video keys grow with each video ID, so directories are named by a fixed-length hash instead
+    index_dir = os.path.join(FAISS_CACHE_DIR, hashlib.sha256(video_key.encode("utf-8")).hexdigest())
+    if _is_saved_index(index_dir) and not rebuild:
+        try:
+            return FAISS.load_local(
+                index_dir,
+                cached_embeddings,
+                allow_dangerous_deserialization=True
+            )
+        except Exception:
+            # A corrupt saved index is rebuilt rather than failing the fetch
+            pass
+
+    # Explicit separators ending in "" guarantee the splitter always makes progress
+    splitter = RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ". ", " ", ""],
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        add_start_index=False
+    )
+    # Auto-captions often repeat, so identical chunks are embedded only once
+    chunks = dedupe_chunks(splitter.split_text(transcript_text))
+
+    vectorstore = build_vectorstore(chunks, cached_embeddings)
+    save_vectorstore(vectorstore, index_dir)
+    return vectorstore